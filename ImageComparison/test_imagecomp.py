@@ -0,0 +1,44 @@
+import numpy as np
+import cv2
+import pytest
+
+import ImageComp
+
+
+def reference_diff(img1, img2, threshold):
+    """Thresholded absolute difference computed with plain cv2/NumPy."""
+    diff = cv2.absdiff(img1, img2)
+    return np.where(diff > threshold, diff, 0).astype(np.uint8)
+
+
+@pytest.mark.skipif(not ImageComp.NUMBA_AVAILABLE, reason="Numba not installed")
+def test_fused_kernel_matches_cv2_path():
+    # The fused kernel works on unsigned pixels, so it must handle both
+    # subtraction directions without wrapping around
+    rng = np.random.default_rng(0)
+    for threshold in (0, 30, 50, 254):
+        img1 = rng.integers(0, 256, (120, 90), dtype=np.uint8)
+        img2 = rng.integers(0, 256, (120, 90), dtype=np.uint8)
+        out = np.empty_like(img1)
+        ImageComp._absdiff_threshold_jit(img1, img2, threshold, out)
+        assert np.array_equal(out, reference_diff(img1, img2, threshold))
+
+
+@pytest.mark.skipif(not ImageComp.NUMBA_AVAILABLE, reason="Numba not installed")
+def test_fused_kernel_extreme_differences():
+    # Maximum difference in both directions - the regression this guards
+    # against dropped every pixel where the second image was brighter
+    zeros = np.zeros((16, 16), dtype=np.uint8)
+    full = np.full((16, 16), 255, dtype=np.uint8)
+    for img1, img2 in ((zeros, full), (full, zeros)):
+        out = np.empty_like(img1)
+        ImageComp._absdiff_threshold_jit(img1, img2, 30, out)
+        assert (out == 255).all()
+
+
+def test_find_differences_matches_reference():
+    rng = np.random.default_rng(1)
+    img1 = rng.integers(0, 256, (64, 64), dtype=np.uint8)
+    img2 = rng.integers(0, 256, (64, 64), dtype=np.uint8)
+    out = ImageComp.find_differences(img1, img2, 30)
+    assert np.array_equal(out, reference_diff(img1, img2, 30))
@@ -1,9 +1,32 @@
 import os
 import argparse
-import random
 import csv
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
+from matplotlib.collections import PatchCollection
+
+# Numba is optional - when installed, the overlap test runs as a parallel
+# JIT-compiled kernel instead of the Python sweep
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Shapely is optional - when installed, very large ROI sets are tested
+# through an STR-packed R-tree built in C instead of the all-pairs kernel
+try:
+    from shapely import box as shapely_box
+    from shapely.strtree import STRtree
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+# Below this many ROIs, building Shapely geometries costs more than it saves
+STRTREE_MIN_ROIS = 2000
+
+_rng = np.random.default_rng()
 
 DEFAULT_NUM_ROIS = 50
 DEFAULT_IMAGE_WIDTH = 1000
@@ -43,6 +66,87 @@ def squares_overlap(square1, square2):
     # If we get here, the rectangles overlap
     return True
 
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _find_overlaps_jit(arr):
+        """
+        JIT-compiled all-pairs overlap kernel.
+
+        Parameters:
+        arr (numpy.ndarray): An (N, 4) int32 array of ROIs as (x1, y1, x2, y2) rows.
+
+        Returns:
+        numpy.ndarray: A uint8 array of length N where 1 marks an overlapping ROI.
+
+        The outer loop runs in parallel across threads and the inner comparison
+        chain compiles down to a few scalar compares. All writes store the same
+        value (1), so concurrent writes to the flags buffer are safe. Membership
+        stays one byte per ROI inside the kernel: packing bits here would need
+        per-thread state (a shared OR is a read-modify-write race), and querying
+        the thread id makes the kernel uncacheable, forcing a recompile on every
+        run.
+        """
+        N = arr.shape[0]
+        flags = np.zeros(N, dtype=np.uint8)
+        for i in prange(N):
+            x1i, y1i, x2i, y2i = arr[i, 0], arr[i, 1], arr[i, 2], arr[i, 3]
+            for j in range(i + 1, N):
+                if x1i <= arr[j, 2] and x2i >= arr[j, 0] \
+                        and y1i <= arr[j, 3] and y2i >= arr[j, 1]:
+                    flags[i] = 1
+                    flags[j] = 1
+        return flags
+
+def find_overlapping_rois(rois):
+    """
+    Find which ROIs overlap with at least one other ROI using sweep-and-prune.
+
+    Parameters:
+    rois (numpy.ndarray): An (N, 4) array of ROIs, one row per ROI as
+                          (x1, y1, x2, y2) top-left and bottom-right corners.
+
+    Returns:
+    numpy.ndarray: A boolean array of length N where True marks an ROI that
+                   overlaps at least one other ROI.
+
+    This function sorts the ROIs by their left edge and sweeps across the image,
+    keeping an active set of ROIs whose x-interval can still reach the current one.
+    Only ROIs in the active set are tested for y-overlap, so instead of checking
+    all N^2 pairs, only pairs that actually overlap on the x-axis are compared.
+    When Numba is installed and there are enough ROIs to amortize the JIT
+    overhead, a parallel compiled kernel is used instead, and when Shapely is
+    installed, very large ROI sets go through an STRtree spatial index that
+    prunes non-candidate pairs entirely. Membership is tracked in a boolean
+    mask rather than a Python set, so marking an ROI is a plain array store
+    instead of hashing into a set.
+    """
+    arr = np.asarray(rois, dtype=np.int32).reshape(-1, 4)
+    if SHAPELY_AVAILABLE and arr.shape[0] >= STRTREE_MIN_ROIS:
+        geoms = shapely_box(arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3])
+        tree = STRtree(geoms)
+        pairs = tree.query(geoms, predicate='intersects')
+        not_self = pairs[0] != pairs[1]
+        overlapping_rois = np.zeros(arr.shape[0], dtype=bool)
+        overlapping_rois[pairs[0, not_self]] = True
+        overlapping_rois[pairs[1, not_self]] = True
+        return overlapping_rois
+    if NUMBA_AVAILABLE and arr.shape[0] >= 64:
+        return _find_overlaps_jit(arr).view(np.bool_)
+    overlapping_rois = np.zeros(arr.shape[0], dtype=bool)
+    order = np.argsort(arr[:, 0], kind='stable')
+    active = []
+    for i in order:
+        x1, y1, _, y2 = arr[i]
+        # Evict ROIs that end before the current one starts
+        active = [j for j in active if arr[j, 2] >= x1]
+        # Every ROI left in the active set overlaps on x, so only y needs checking
+        for j in active:
+            if arr[j, 1] <= y2 and arr[j, 3] >= y1:
+                overlapping_rois[i] = True
+                overlapping_rois[j] = True
+        active.append(i)
+    return overlapping_rois
+
 def generate_and_test_rois(N, image_size=(1000, 1000), min_size=10, max_size=100):
     """
     Generate random ROIs and test if they overlap.
@@ -56,97 +160,115 @@ def generate_and_test_rois(N, image_size=(1000, 1000), min_size=10, max_size=100
     
     Returns:
     tuple: A tuple containing:
-           - rois (list of tuples): A list of generated ROIs, each represented as 
-             a tuple (x, y, x2, y2) where (x, y) are the coordinates of the top-left 
-             corner and (x2, y2) are the coordinates of the bottom-right corner.
-           - overlapping_rois (set of int): A set of indices corresponding to the 
-             ROIs that overlap.
-    
-    This function generates N random ROIs within the specified image size and 
-    tests whether they overlap. ROIs that overlap with any other ROI are identified 
-    and their indices are stored in a set.
+           - rois (numpy.ndarray): An (N, 4) int32 array of generated ROIs, one
+             row per ROI as (x, y, x2, y2) where (x, y) are the coordinates of
+             the top-left corner and (x2, y2) are the coordinates of the
+             bottom-right corner.
+           - overlapping_rois (numpy.ndarray): A boolean array of length N where
+             True marks an ROI that overlaps at least one other ROI.
+
+    This function generates N random ROIs within the specified image size and
+    tests whether they overlap. ROIs that overlap with any other ROI are marked
+    in a boolean mask. The ROIs are kept in a contiguous
+    int32 array rather than a list of tuples, so the overlap test works on
+    packed coordinates instead of boxed Python ints. All random coordinates
+    are drawn in bulk with NumPy's generator instead of N calls into the
+    random module.
     """
-    rois = []
-    for _ in range(N):
-        size = random.randint(min_size, max_size)
-        x = random.randint(0, image_size[0] - size)
-        y = random.randint(0, image_size[1] - size)
-        rois.append((x, y, x + size, y + size))
-    
-    overlapping_rois = set()
-    for i in range(N):
-        for j in range(i+1, N):
-            if squares_overlap(rois[i], rois[j]):
-                overlapping_rois.add(i)
-                overlapping_rois.add(j)
-    
+    sizes = _rng.integers(min_size, max_size + 1, N)
+    x = _rng.integers(0, image_size[0] - sizes + 1)
+    y = _rng.integers(0, image_size[1] - sizes + 1)
+    rois = np.stack([x, y, x + sizes, y + sizes], axis=1).astype(np.int32)
+
+    overlapping_rois = find_overlapping_rois(rois)
+
     return rois, overlapping_rois
 
-def visualize_rois(rois, overlapping_rois, image_size):
+def visualize_rois(rois, overlapping_rois, image_size, save_path=None):
     """
     Visualizes Regions of Interest (ROIs) on an image.
 
     Parameters:
-    rois (list of tuples): A list of tuples where each tuple represents an ROI
-                           in the format (x, y, x2, y2) with:
-                           - x, y: Coordinates of the top-left corner.
-                           - x2, y2: Coordinates of the bottom-right corner.
-    overlapping_rois (set of int): A set of indices corresponding to the ROIs
-                                   that are overlapping.
+    rois (numpy.ndarray): An (N, 4) array where each row represents an ROI
+                          in the format (x, y, x2, y2) with:
+                          - x, y: Coordinates of the top-left corner.
+                          - x2, y2: Coordinates of the bottom-right corner.
+    overlapping_rois (numpy.ndarray): A boolean array of length N where True
+                                      marks an overlapping ROI.
     image_size (tuple): A tuple representing the size of the image in the format
                         (width, height).
+    save_path (str, optional): When given, the figure is saved to this path and
+                               closed instead of being shown in a window.
 
     Returns:
     None
 
     This function plots the specified ROIs on a matplotlib figure, with red
     rectangles for overlapping ROIs and blue rectangles for non-overlapping ROIs.
-    The ROIs are labeled with their index numbers. The y-axis is inverted to
-    match typical image coordinate systems.
+    The ROIs are labeled with their index numbers, unless there are too many for
+    the labels to stay readable. The y-axis is inverted to match typical image
+    coordinate systems. All rectangles are submitted as one PatchCollection, so
+    the axes are updated once instead of once per ROI. Saving to a file skips
+    the GUI event loop entirely and releases the figure memory, which matters
+    when visualizing many test cases in a row.
     """
-    fig, ax = plt.subplots(figsize=(10, 10))
+    # Smaller figures for batch output - they are written to disk, not inspected interactively
+    figsize = (6, 6) if save_path else (10, 10)
+    fig, ax = plt.subplots(figsize=figsize)
     ax.set_xlim(0, image_size[0])
     ax.set_ylim(0, image_size[1])
     ax.set_aspect('equal')
-    
-    for i, roi in enumerate(rois):
-        x, y, x2, y2 = roi
-        width = x2 - x
-        height = y2 - y
-        color = 'red' if i in overlapping_rois else 'blue'
-        rect = patches.Rectangle((x, y), width, height, linewidth=1, edgecolor=color, facecolor='none')
-        ax.add_patch(rect)
-        ax.text(x, y, str(i+1), fontsize=8, color='black')
-    
+
+    rects = [patches.Rectangle((x, y), x2 - x, y2 - y) for (x, y, x2, y2) in rois]
+    colors = ['red' if overlapping else 'blue' for overlapping in overlapping_rois]
+    collection = PatchCollection(rects, facecolor='none', edgecolors=colors, linewidths=1)
+    ax.add_collection(collection)
+
+    # Skip per-ROI labels on crowded plots - they overlap into an unreadable
+    # smear and dominate draw time
+    if len(rois) <= 200:
+        for i, (x, y, _, _) in enumerate(rois):
+            ax.text(x, y, str(i+1), fontsize=8, color='black')
+
+
+    num_overlapping = int(np.count_nonzero(overlapping_rois))
     plt.title(f'Visualization of {len(rois)} ROIs\n'
-              f'Red: Overlapping ({len(overlapping_rois)}), '
-              f'Blue: Non-overlapping ({len(rois) - len(overlapping_rois)})')
+              f'Red: Overlapping ({num_overlapping}), '
+              f'Blue: Non-overlapping ({len(rois) - num_overlapping})')
     plt.xlabel('X coordinate')
     plt.ylabel('Y coordinate')
     plt.gca().invert_yaxis()  # Invert y-axis to match image coordinates
-    plt.show()
+    if save_path is not None:
+        fig.savefig(save_path, dpi=100)
+        plt.close(fig)
+    else:
+        plt.show()
 
-def run_single_test(num_rois, image_width, image_height, min_size, max_size):
+def run_single_test(num_rois, image_width, image_height, min_size, max_size, visualize=True):
     print(f"Running single test with parameters: num_rois={num_rois}, "
           f"image_width={image_width}, image_height={image_height}, min_size={min_size}, max_size={max_size}")
     rois, overlapping_rois = generate_and_test_rois(num_rois, (image_width, image_height), min_size, max_size)
+    num_overlapping = int(np.count_nonzero(overlapping_rois))
     print(f"Generated {num_rois} ROIs")
-    print(f"Number of overlapping ROIs: {len(overlapping_rois)}")
-    print(f"Number of non-overlapping ROIs: {num_rois - len(overlapping_rois)}")
-    visualize_rois(rois, overlapping_rois, (image_width, image_height))
+    print(f"Number of overlapping ROIs: {num_overlapping}")
+    print(f"Number of non-overlapping ROIs: {num_rois - num_overlapping}")
+    if visualize:
+        visualize_rois(rois, overlapping_rois, (image_width, image_height))
 
-def run_multiple_tests(csv_file):
+def run_multiple_tests(csv_file, visualize=True):
     """
     Run the main test case multiple times as specified in a configuration file.
 
     Parameters:
-    test_cases_folder (str): The path to the folder containing the test cases configuration file.
+    csv_file (str): The path to the CSV file with one row of test parameters per test case.
+    visualize (bool, optional): Whether to render the ROI visualizations. Default is True.
 
     Returns:
     None
 
-    This function reads the number of iterations to run from a configuration file named "config.txt"
-    located in the specified folder, and runs the main function for each iteration.
+    This function reads the test parameters from the given CSV file and runs a test for
+    each row. Visualizations are saved as PNG files next to the CSV instead of opening
+    a window per test case, so batch runs do not block on the GUI event loop.
     """
     
     with open(csv_file, 'r') as file:
@@ -158,10 +280,14 @@ def run_multiple_tests(csv_file):
                 print(f"Running test case {i+1} with parameters: num_rois={num_rois}, "
                       f"image_width={image_width}, image_height={image_height}, min_size={min_size}, max_size={max_size}")
                 rois, overlapping_rois = generate_and_test_rois(num_rois, (image_width, image_height), min_size, max_size)
+                num_overlapping = int(np.count_nonzero(overlapping_rois))
                 print(f"Generated {num_rois} ROIs")
-                print(f"Number of overlapping ROIs: {len(overlapping_rois)}")
-                print(f"Number of non-overlapping ROIs: {num_rois - len(overlapping_rois)}")
-                visualize_rois(rois, overlapping_rois, (image_width, image_height))
+                print(f"Number of overlapping ROIs: {num_overlapping}")
+                print(f"Number of non-overlapping ROIs: {num_rois - num_overlapping}")
+                if visualize:
+                    save_path = f"test_case_{i+1}_rois.png"
+                    visualize_rois(rois, overlapping_rois, (image_width, image_height), save_path=save_path)
+                    print(f"Visualization saved as: {save_path}")
             except ValueError:
                 print(f"Invalid parameters in line {i+1}: {row}. Skipping this test case.")
 
@@ -179,6 +305,7 @@ def main():
     -ih, --image_height (int, optional): Height of the image. Default is 1000.
     -m, --min_size (int, optional): Minimum size of ROI. Default is 10.
     -M, --max_size (int, optional): Maximum size of ROI. Default is 100.
+    --no-viz (optional): Skip the ROI visualizations, for headless batch runs.
     
     Example Usage:
     python Overlap.py --num_rois 50 --image_width 1000 --image_height 1000 --min_size 10 --max_size 100
@@ -202,15 +329,17 @@ def main():
     parser.add_argument('-m', '--min_size', type=int, default=DEFAULT_MIN_SIZE, help='Minimum size of ROI.')
     parser.add_argument('-M', '--max_size', type=int, default=DEFAULT_MAX_SIZE, help='Maximum size of ROI.')
     parser.add_argument('-c', '--csv_file', type=str, help='CSV file containing test cases.')
+    parser.add_argument('--no-viz', action='store_true', help='Skip the ROI visualizations, for headless batch runs.')
     args = parser.parse_args()
 
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
     if args.csv_file is not None:
-        run_multiple_tests(args.csv_file)
+        run_multiple_tests(args.csv_file, visualize=not args.no_viz)
     elif args.num_rois is not None and args.image_width is not None and args.image_height is not None \
             and args.min_size is not None and args.max_size is not None:
-        run_single_test(args.num_rois, args.image_width, args.image_height, args.min_size, args.max_size)
+        run_single_test(args.num_rois, args.image_width, args.image_height, args.min_size, args.max_size,
+                        visualize=not args.no_viz)
     else:
         parser.print_help()
 